@@ -1,100 +1,175 @@
 import discord
 import aiohttp
 import asyncio
-import json
+import atexit
+import orjson
 import config
 import os
+import re
+import signal
 import tempfile
-import shutil
+import time
 from datetime import datetime
 
 intents = discord.Intents.default()
 client = discord.Client(intents=intents)
 
 POSTED_FILE = "posted.json"
+POSTED_LOG = "posted.log"
+COMPACT_EVERY = 500
 DEFAULT_IMAGE = "https://cdn.discordapp.com/attachments/920731720645500978/1350138518608937081/6794d187-3c79-4a3c-83bb-c9d08e768fa1.webp"
 
 API_URL = "https://scriptblox.com/api/script/fetch"
-CHECK_INTERVAL = 10
+CHECK_INTERVAL = config.CHECK_DELAY
 MAX_RETRIES = 3
+BANNED_RE = re.compile(r"error|nil|invalid|fail|patched", re.IGNORECASE)
 
 WEBHOOK_URL = config.WEBHOOK_URL
 http_session = None
+webhook = None
+last_etag = None
+last_modified = None
 
 posted_ids = set()
-is_checking = False
+broken_cache = {}
+log_entries = 0
+process_lock = asyncio.Lock()
+main_task = None
+close_task = None
 
 
 # ======================================================
 # LOGGER
 # ======================================================
 def log(msg):
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}")
 
 
 # ======================================================
-# SAFE LOAD / SAVE posted.json
+# SAFE LOAD / SAVE posted.json + posted.log
 # ======================================================
+# posted.json is a snapshot, posted.log holds one id per line
+# appended since the last snapshot. save_posted_ids() compacts both.
 def load_posted_ids():
-    global posted_ids
-    if not os.path.exists(POSTED_FILE):
-        posted_ids = set()
-        return
+    global posted_ids, log_entries
+    posted_ids = set()
+    log_entries = 0
+    damaged = False
 
-    try:
-        with open(POSTED_FILE, "r") as f:
-            posted_ids = set(json.load(f))
-    except:
-        log("posted.json damaged → recreating")
-        posted_ids = set()
+    if os.path.exists(POSTED_FILE):
+        try:
+            with open(POSTED_FILE, "rb") as f:
+                posted_ids = set(orjson.loads(f.read()))
+        except:
+            log("posted.json damaged → recreating")
+            damaged = True
+
+    if os.path.exists(POSTED_LOG):
+        with open(POSTED_LOG, "r") as f:
+            logged = f.read().split()
+        posted_ids.update(logged)
+        log_entries = len(logged)
+
+    if damaged:
         save_posted_ids()
 
 
 def save_posted_ids():
-    fd, temp_path = tempfile.mkstemp(suffix=".json")
+    global log_entries
+    # same directory as posted.json → os.replace is an atomic rename
+    fd, temp_path = tempfile.mkstemp(
+        suffix=".json", dir=os.path.dirname(os.path.abspath(POSTED_FILE))
+    )
     try:
-        with os.fdopen(fd, "w") as f:
-            json.dump(list(posted_ids), f, indent=4)
-        shutil.move(temp_path, POSTED_FILE)
+        payload = orjson.dumps(list(posted_ids))
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, POSTED_FILE)
     except:
         log("Error saving posted.json")
         if os.path.exists(temp_path):
             os.remove(temp_path)
+        return
+
+    # snapshot is up to date → the log can start over
+    try:
+        open(POSTED_LOG, "w").close()
+    except:
+        log("Error truncating posted.log")
+        return
+    log_entries = 0
+
+
+def append_posted_id(sid):
+    global log_entries
+    try:
+        with open(POSTED_LOG, "a") as f:
+            f.write(sid + "\n")
+    except:
+        log("Error appending posted.log")
+        return
+
+    log_entries += 1
+    if log_entries >= COMPACT_EVERY:
+        save_posted_ids()
+
+
+def compact_posted_ids():
+    if log_entries:
+        save_posted_ids()
+
+
+atexit.register(compact_posted_ids)
 
 
 # ======================================================
 # CLEANUP
 # ======================================================
 def cleanup_removed_scripts(live_ids):
-    removed = [sid for sid in posted_ids if sid not in live_ids]
+    for sid in broken_cache.keys() - live_ids:
+        del broken_cache[sid]
+
+    before = len(posted_ids)
+    posted_ids.intersection_update(live_ids)
+    removed = before - len(posted_ids)
     if not removed:
         return
 
-    for sid in removed:
-        posted_ids.discard(sid)
-
     save_posted_ids()
-    log(f"Cleanup removed {len(removed)} deleted scripts")
+    log(f"Cleanup removed {removed} deleted scripts")
 
 
 # ======================================================
 # SCRIPT VALIDATION
 # ======================================================
 def script_is_broken(script_data):
+    # cheapest checks first, regex scan last
+    if script_data.get("isPatched"):
+        return True
+
     script = script_data.get("script", "") or ""
     if len(script) < 5:
         return True
 
-    banned = ["error", "nil", "invalid", "fail", "patched"]
-    low = script.lower()
-    return any(bad in low for bad in banned)
+    # broken scripts are never posted → reuse the verdict while unchanged
+    sid = script_data.get("_id")
+    fingerprint = (len(script), hash(script))
+    cached = broken_cache.get(sid)
+    if cached and cached[0] == fingerprint:
+        return cached[1]
+
+    broken = BANNED_RE.search(script) is not None
+    broken_cache[sid] = (fingerprint, broken)
+    return broken
 
 
 # ======================================================
 # IMAGE
 # ======================================================
 def get_image_url(script):
-    game = script.get("game", {})
+    game = script.get("game") or {}
     image = game.get("imageUrl", "")
 
     if image:
@@ -119,16 +194,30 @@ def format_date(ts):
 # ======================================================
 async def create_session():
     global http_session
-    if http_session is None:
-        http_session = aiohttp.ClientSession()
-        log("HTTP session opened")
+    if http_session and not http_session.closed:
+        return
+
+    # keep the TLS connection to the API alive across polls
+    connector = aiohttp.TCPConnector(
+        limit=32,
+        limit_per_host=8,
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+        enable_cleanup_closed=True
+    )
+    http_session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=15, sock_connect=5)
+    )
+    log("HTTP session opened")
 
 
 async def close_session():
-    global http_session
+    global http_session, webhook
     if http_session:
         await http_session.close()
         http_session = None
+        webhook = None
         log("HTTP session closed")
 
 
@@ -136,15 +225,27 @@ async def close_session():
 # FETCH SCRIPTS
 # ======================================================
 async def fetch_scripts():
+    # returns None when the API answers 304 Not Modified
+    global last_etag, last_modified
     await create_session()
 
+    headers = {}
+    if last_etag:
+        headers["If-None-Match"] = last_etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            async with http_session.get(API_URL) as r:
+            async with http_session.get(API_URL, headers=headers) as r:
+                if r.status == 304:
+                    return None
                 if r.status != 200:
                     await asyncio.sleep(attempt)
                     continue
-                data = await r.json()
+                data = orjson.loads(await r.read())
+                last_etag = r.headers.get("ETag")
+                last_modified = r.headers.get("Last-Modified")
                 result = data.get("result", {})
                 return result.get("scripts", [])
         except Exception as e:
@@ -159,29 +260,36 @@ async def fetch_scripts():
 # WEBHOOK POST
 # ======================================================
 async def webhook_send(script):
+    global webhook
     code_raw = script.get("script", "")
     code_short = code_raw[:1900]  # Discord limit safe
+    game_name = (script.get("game") or {}).get("name")
+    image = get_image_url(script)
 
     embed = {
-        "title": f"🎮 {script.get('game', {}).get('name', 'Unknown Game')}",
+        "title": f"🎮 {game_name or 'Unknown Game'}",
         "description": script.get("title", "Unknown Script"),
         "color": 0xFF0000,
-        "thumbnail": {"url": get_image_url(script)},
+        "thumbnail": {"url": image},
         "fields": [
             {"name": "⌛ Created", "value": format_date(script.get("createdAt")), "inline": True},
             {"name": "📜 Script", "value": f"```lua\n{code_short}\n```", "inline": False}
         ],
         "footer": {
-            "text": script.get("game", {}).get("name", ""),
-            "icon_url": get_image_url(script)
+            "text": game_name or "",
+            "icon_url": image
         }
     }
 
     await create_session()
 
     try:
-        async with http_session.post(WEBHOOK_URL, json={"embeds": [embed]}) as res:
-            return res.status in (200, 204)
+        # built lazily so a bad WEBHOOK_URL only fails posts, not fetching
+        if webhook is None:
+            # discord.py handles the webhook rate limit buckets on this session
+            webhook = discord.Webhook.from_url(WEBHOOK_URL, session=http_session)
+        await webhook.send(embed=discord.Embed.from_dict(embed))
+        return True
     except Exception as e:
         log(f"Webhook send error: {e}")
         return False
@@ -190,39 +298,62 @@ async def webhook_send(script):
 # ======================================================
 # PROCESSOR
 # ======================================================
+async def post_script(script):
+    ok = await webhook_send(script)
+    if ok:
+        # append right away so a post survives a hard kill
+        sid = script["_id"]
+        posted_ids.add(sid)
+        append_posted_id(sid)
+        log(f"Posted: {script.get('title')}")
+    return ok
+
+
 async def process_scripts():
-    global is_checking
-    if is_checking:
+    global last_etag, last_modified
+    # a cycle is still running → skip this tick
+    if process_lock.locked():
         return
 
-    is_checking = True
+    async with process_lock:
+        failed = False
 
-    try:
-        scripts = await fetch_scripts()
-        live_ids = {s.get("_id") for s in scripts}
+        try:
+            scripts = await fetch_scripts()
+            # 304 or failed fetch → nothing to compare against
+            if not scripts:
+                return
 
-        cleanup_removed_scripts(live_ids)
+            by_id = {s["_id"]: s for s in scripts if s.get("_id")}
+            live_ids = by_id.keys()
 
-        for s in scripts:
-            sid = s.get("_id")
-            if not sid or sid in posted_ids:
-                continue
+            cleanup_removed_scripts(live_ids)
 
-            if script_is_broken(s):
-                continue
+            # steady state: everything listed is already posted
+            new_ids = live_ids - posted_ids
+            if not new_ids:
+                return
 
-            ok = await webhook_send(s)
-            if ok:
-                posted_ids.add(sid)
-                save_posted_ids()
-                log(f"Posted: {s.get('title')}")
+            # walk by_id to keep feed order
+            candidates = [
+                s for sid, s in by_id.items()
+                if sid in new_ids and not script_is_broken(s)
+            ]
 
-            await asyncio.sleep(0.4)
+            # one at a time in feed order; discord.py's webhook rate limiter paces the sends
+            for s in candidates:
+                if not await post_script(s):
+                    failed = True
 
-    except Exception as e:
-        log(f"PROCESS ERROR: {e}")
+        except Exception as e:
+            log(f"PROCESS ERROR: {e}")
+            failed = True
 
-    is_checking = False
+        finally:
+            # unposted scripts left → force a full fetch next poll instead of a 304
+            if failed:
+                last_etag = None
+                last_modified = None
 
 
 # ======================================================
@@ -244,17 +375,59 @@ async def main_loop():
 # ======================================================
 @client.event
 async def on_ready():
+    global main_task
     log(f"Bot Online → {client.user}")
 
     await client.change_presence(
         activity=discord.Activity(type=discord.ActivityType.watching, name="ScriptBlox 🔍")
     )
 
+    # on_ready fires again after reconnects → keep a single poll loop
+    if main_task and not main_task.done():
+        return
+
     load_posted_ids()
     log(f"Loaded {len(posted_ids)} scripts")
 
-    asyncio.create_task(main_loop())
+    main_task = asyncio.create_task(main_loop())
+
+
+@client.event
+async def on_disconnect():
+    compact_posted_ids()
+
+
+def request_close():
+    global close_task
+    # keep a reference so the task is not garbage collected before it runs
+    close_task = asyncio.create_task(client.close())
+
+
+async def run_bot():
+    # docker stop sends SIGTERM → close the client so the cleanup below and atexit run
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, request_close)
+    except NotImplementedError:
+        # Windows event loops have no signal handlers → Ctrl+C still works
+        pass
+
+    try:
+        async with client:
+            await client.start(config.TOKEN)
+    finally:
+        # stop polling first, or an in-flight post would reopen the session
+        if main_task:
+            main_task.cancel()
+            await asyncio.gather(main_task, return_exceptions=True)
+        await client.close()
+
+        # still inside the running loop → connector closes cleanly
+        await close_session()
 
 
 if __name__ == "__main__":
-    client.run(config.TOKEN)
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run_bot())
+    except KeyboardInterrupt:
+        pass